@@ -155,6 +155,7 @@ class CapabilitiesModel(object, metaclass=Singleton):
             }
         elif not self.libvirtd_running:
             # Libvirt returned, run tests again
+            FeatureTests.invalidate()
             self._set_capabilities()
             self._set_depend_capabilities()
 
@@ -16,13 +16,12 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+import functools
 import platform
-import subprocess
 
 import cherrypy
 import libvirt
-import lxml.etree as ET
-from lxml.builder import E
+from wok.exception import TimeoutExpired
 from wok.utils import run_command
 from wok.utils import servermethod
 from wok.utils import wok_log
@@ -90,6 +89,8 @@ DEV_MEM_XML = """
   </target>
 </memory>"""
 
+NFS_PROBE_XML = "<source><host name='127.0.0.1'/><format type='nfs'/></source>"
+
 SCSI_FC_XML = """
 <pool type='scsi'>
   <name>%(name)s</name>
@@ -102,19 +103,102 @@ SCSI_FC_XML = """
 </pool>
 """
 
+# Host architecture as libvirt names it for the probe domains
+_HOST_MACHINE = platform.machine()
+_HOST_ARCH_FOR_LIBVIRT = 'ppc64' if _HOST_MACHINE == 'ppc64le' else _HOST_MACHINE
+
+
+@functools.lru_cache(maxsize=8)
+def _domain_type_and_arch(conn_type):
+    """Return the (domain type, arch) pair of probe domains for conn_type."""
+    if conn_type.lower() == 'test':
+        return 'test', 'i686'
+    return 'kvm', _HOST_ARCH_FOR_LIBVIRT
+
+
+# Substituted probe XMLs: their parameters take very few values per host
+_ISO_STREAM_XML_CACHE = {}
+_MAXMEM_VM_XML_CACHE = {}
+_SCSI_FC_POOL_XML = SCSI_FC_XML % {'name': FEATURETEST_POOL_NAME}
+
+
+def _iso_stream_xml(domain_type, arch, protocol):
+    key = (domain_type, arch, protocol)
+    xml = _ISO_STREAM_XML_CACHE.get(key)
+    if xml is None:
+        xml = _ISO_STREAM_XML_CACHE[key] = ISO_STREAM_XML % {
+            'name': FEATURETEST_VM_NAME,
+            'domain': domain_type,
+            'protocol': protocol,
+            'arch': arch,
+        }
+    return xml
+
+
+def _maxmem_vm_xml(domain_type, arch):
+    key = (domain_type, arch)
+    xml = _MAXMEM_VM_XML_CACHE.get(key)
+    if xml is None:
+        xml = _MAXMEM_VM_XML_CACHE[key] = MAXMEM_VM_XML % {
+            'name': FEATURETEST_VM_NAME,
+            'domain': domain_type,
+            'arch': arch,
+        }
+    return xml
+
+
+def _safe_undefine(obj):
+    """Undefine a feature test domain or storage pool, logging any failure."""
+    if obj is None:
+        return
+    try:
+        obj.undefine()
+    except libvirt.libvirtError as e:
+        wok_log.warning(f'Unable to undefine feature test object: {e}')
+
+
+def _libvirt_errorhandler(userdata, error):
+    # A libvirt error handler to ignore annoying messages in stderr
+    pass
+
 
 class FeatureTests(object):
+    # Probe results keyed by probe name (plus connection and arguments when
+    # the answer depends on them). They are stable for the daemon lifetime.
+    _cache = {}
+
+    # The probes leave the libvirt error handler registered, so only the
+    # first one crosses into libvirt to install it
+    _libvirt_errorhandler_registered = False
+
     @staticmethod
-    def disable_libvirt_error_logging():
-        def libvirt_errorhandler(userdata, error):
-            # A libvirt error handler to ignore annoying messages in stderr
-            pass
+    def _memoize(key, probe):
+        try:
+            return FeatureTests._cache[key]
+        except KeyError:
+            result = FeatureTests._cache[key] = probe()
+            return result
 
+    @staticmethod
+    def _conn_key(conn):
+        return (conn.getType(), conn.getURI())
+
+    @staticmethod
+    def invalidate():
+        """Drop all cached probe results so the next calls run them again."""
+        FeatureTests._cache.clear()
+
+    @staticmethod
+    def disable_libvirt_error_logging():
         # Filter functions are enable only in production env
         if cherrypy.config.get('environment') != 'production':
             return
+        # Nothing to do if the handler is already in place
+        if FeatureTests._libvirt_errorhandler_registered:
+            return
         # Register the error handler to hide libvirt error in stderr
-        libvirt.registerErrorHandler(f=libvirt_errorhandler, ctx=None)
+        libvirt.registerErrorHandler(f=_libvirt_errorhandler, ctx=None)
+        FeatureTests._libvirt_errorhandler_registered = True
 
     @staticmethod
     def enable_libvirt_error_logging():
@@ -123,95 +207,103 @@ class FeatureTests(object):
             return
         # Unregister the error handler
         libvirt.registerErrorHandler(f=None, ctx=None)
+        FeatureTests._libvirt_errorhandler_registered = False
 
     @staticmethod
     def libvirt_supports_iso_stream(conn, protocol):
-        conn_type = conn.getType().lower()
-        domain_type = 'test' if conn_type == 'test' else 'kvm'
-        arch = 'i686' if conn_type == 'test' else platform.machine()
-        arch = 'ppc64' if arch == 'ppc64le' else arch
-        xml = ISO_STREAM_XML % {
-            'name': FEATURETEST_VM_NAME,
-            'domain': domain_type,
-            'protocol': protocol,
-            'arch': arch,
-        }
-        try:
+        def _probe():
+            domain_type, arch = _domain_type_and_arch(conn.getType())
+            xml = _iso_stream_xml(domain_type, arch, protocol)
+            dom = None
             FeatureTests.disable_libvirt_error_logging()
-            dom = conn.defineXML(xml)
-            dom.undefine()
-            return True
-        except libvirt.libvirtError as e:
-            wok_log.error(str(e))
-            return False
-        finally:
-            FeatureTests.enable_libvirt_error_logging()
+            try:
+                dom = conn.defineXML(xml)
+                return True
+            except libvirt.libvirtError as e:
+                wok_log.error(str(e))
+                return False
+            finally:
+                _safe_undefine(dom)
+
+        key = ('iso_stream',) + FeatureTests._conn_key(conn) + (protocol,)
+        return FeatureTests._memoize(key, _probe)
 
     @staticmethod
     def libvirt_support_nfs_probe(conn):
-        def _get_xml():
-            obj = E.source(E.host(name='127.0.0.1'), E.format(type='nfs'))
-            xml = ET.tostring(obj, encoding='unicode')
-            return xml
-
-        try:
+        def _probe():
             FeatureTests.disable_libvirt_error_logging()
-            conn.findStoragePoolSources('netfs', _get_xml(), 0)
-        except libvirt.libvirtError as e:
-            wok_log.error(str(e))
-            if e.get_error_code() == 38:
-                # if libvirt cannot find showmount,
-                # it returns 38--general system call failure
-                return False
-        finally:
-            FeatureTests.enable_libvirt_error_logging()
+            try:
+                conn.findStoragePoolSources('netfs', NFS_PROBE_XML, 0)
+            except libvirt.libvirtError as e:
+                wok_log.error(str(e))
+                if e.get_error_code() == 38:
+                    # if libvirt cannot find showmount,
+                    # it returns 38--general system call failure
+                    return False
 
-        return True
+            return True
+
+        key = ('nfs_probe',) + FeatureTests._conn_key(conn)
+        return FeatureTests._memoize(key, _probe)
 
     @staticmethod
     @servermethod
     def qemu_supports_iso_stream():
         host = cherrypy.server.socket_host
         port = cherrypy.server.socket_port
-        cmd = (
-            "qemu-io -r http://%s:%d/plugins/kimchi/images/icon-fedora.png \
-              -c 'read -v 0 512'"
-            % (host, port)
-        )
-        proc = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True
-        )
-        stdout, stderr = proc.communicate()
-        return len(stderr) == 0
+
+        def _probe():
+            cmd = [
+                'qemu-io',
+                '-r',
+                'http://%s:%d/plugins/kimchi/images/icon-fedora.png' % (host, port),
+                '-c',
+                'read -v 0 512',
+            ]
+            try:
+                out, err, rc = run_command(cmd, 10, silent=True)
+            except TimeoutExpired:
+                wok_log.warning('Timeout probing QEMU stream support.')
+                return False
+            return rc == 0 and not err
+
+        return FeatureTests._memoize(('qemu_stream', host, port), _probe)
 
     @staticmethod
     def libvirt_support_fc_host(conn):
-        pool = None
-        try:
+        def _probe():
+            pool = None
             FeatureTests.disable_libvirt_error_logging()
-            pool_xml = SCSI_FC_XML % {'name': FEATURETEST_POOL_NAME}
-            pool = conn.storagePoolDefineXML(pool_xml, 0)
-        except libvirt.libvirtError as e:
-            if e.get_error_code() == 27:
-                # Libvirt requires adapter name, not needed when supports to FC
-                return False
-        finally:
-            FeatureTests.enable_libvirt_error_logging()
-            pool is None or pool.undefine()
-        return True
+            try:
+                pool = conn.storagePoolDefineXML(_SCSI_FC_POOL_XML, 0)
+            except libvirt.libvirtError as e:
+                if e.get_error_code() == 27:
+                    # Libvirt requires adapter name, not needed when supports to FC
+                    return False
+            finally:
+                _safe_undefine(pool)
+            return True
+
+        key = ('fc_host',) + FeatureTests._conn_key(conn)
+        return FeatureTests._memoize(key, _probe)
 
     @staticmethod
     def kernel_support_vfio():
-        out, err, rc = run_command(['modprobe', 'vfio-pci'])
-        if rc != 0:
-            wok_log.warning('Unable to load Kernal module vfio-pci.')
-            return False
-        return True
+        def _probe():
+            out, err, rc = run_command(['modprobe', 'vfio-pci'])
+            if rc != 0:
+                wok_log.warning('Unable to load Kernal module vfio-pci.')
+                return False
+            return True
+
+        return FeatureTests._memoize(('kernel_vfio',), _probe)
 
     @staticmethod
     def is_nm_running():
         """Tries to determine whether NetworkManager is running."""
 
+        # Not cached: NetworkManager can be started or stopped at any time
+        # and ConfigModel.lookup() reports its current state.
         out, err, rc = run_command(['nmcli', 'dev', 'status'])
         if rc != 0:
             return False
@@ -227,25 +319,22 @@ class FeatureTests(object):
         # Libvirt < 1.2.14 does not support memory devices, so try to attach a
         # device. Then check if QEMU (>= 2.1) supports memory hotplug, starting
         # the guest These steps avoid errors with Libvirt 'test' driver for KVM
-        conn_type = conn.getType().lower()
-        domain_type = 'test' if conn_type == 'test' else 'kvm'
-        arch = 'i686' if conn_type == 'test' else platform.machine()
-        arch = 'ppc64' if arch == 'ppc64le' else arch
+        def _probe():
+            domain_type, arch = _domain_type_and_arch(conn.getType())
 
-        dom = None
-        try:
+            dom = None
             FeatureTests.disable_libvirt_error_logging()
-            dom = conn.defineXML(
-                MAXMEM_VM_XML
-                % {'name': FEATURETEST_VM_NAME, 'domain': domain_type, 'arch': arch}
-            )
-            dom.attachDeviceFlags(DEV_MEM_XML, libvirt.VIR_DOMAIN_MEM_CONFIG)
-            dom.create()
-        except libvirt.libvirtError:
-            return False
-        finally:
-            if dom and dom.isActive() == 1:
-                dom.destroy()
-            dom is None or dom.undefine()
-            FeatureTests.enable_libvirt_error_logging()
-        return True
+            try:
+                dom = conn.defineXML(_maxmem_vm_xml(domain_type, arch))
+                dom.attachDeviceFlags(DEV_MEM_XML, libvirt.VIR_DOMAIN_MEM_CONFIG)
+                dom.create()
+            except libvirt.libvirtError:
+                return False
+            finally:
+                if dom and dom.isActive() == 1:
+                    dom.destroy()
+                _safe_undefine(dom)
+            return True
+
+        key = ('mem_hotplug',) + FeatureTests._conn_key(conn)
+        return FeatureTests._memoize(key, _probe)
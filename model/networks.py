@@ -28,9 +28,9 @@ from wok.exception import MissingParameter
 from wok.exception import NotFoundError
 from wok.exception import OperationFailed
 from wok.plugins.kimchi import network as netinfo
+from wok.plugins.kimchi import osinfo
 from wok.plugins.kimchi.config import kimchiPaths
 from wok.plugins.kimchi.model.featuretests import FeatureTests
-from wok.plugins.kimchi.osinfo import defaults as tmpl_defaults
 from wok.plugins.kimchi.xmlutils.interface import get_iface_xml
 from wok.plugins.kimchi.xmlutils.network import create_linux_bridge_xml
 from wok.plugins.kimchi.xmlutils.network import create_vlan_tagged_bridge_xml
@@ -52,7 +52,7 @@ class NetworksModel(object):
                 self._check_default_networks()
 
     def _check_default_networks(self):
-        networks = list(set(tmpl_defaults.get('networks', [])))
+        networks = list(set(osinfo.defaults.get('networks', [])))
 
         conn = self.conn.get()
 
@@ -413,7 +413,7 @@ class NetworkModel(object):
         vms = self._get_vms_attach_to_a_network(name)
         tmpls = self._is_network_used_by_template(name)
 
-        if name in tmpl_defaults['networks']:
+        if name in osinfo.defaults['networks']:
             return True, vms, tmpls
 
         return bool(vms) or bool(tmpls), vms, tmpls
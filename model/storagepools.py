@@ -24,13 +24,13 @@ from wok.exception import InvalidOperation
 from wok.exception import MissingParameter
 from wok.exception import NotFoundError
 from wok.exception import OperationFailed
+from wok.plugins.kimchi import osinfo
 from wok.plugins.kimchi.config import config
 from wok.plugins.kimchi.config import get_kimchi_version
 from wok.plugins.kimchi.config import kimchiPaths
 from wok.plugins.kimchi.model.config import CapabilitiesModel
 from wok.plugins.kimchi.model.host import DeviceModel
 from wok.plugins.kimchi.model.libvirtstoragepool import StoragePoolDef
-from wok.plugins.kimchi.osinfo import defaults as tmpl_defaults
 from wok.plugins.kimchi.scan import Scanner
 from wok.plugins.kimchi.utils import is_s390x
 from wok.plugins.kimchi.utils import pool_name_from_uri
@@ -81,6 +81,7 @@ class StoragePoolsModel(object):
 
     def _check_default_pools(self):
         pools = {}
+        tmpl_defaults = osinfo.defaults
 
         # Don't create default pool if it's not
         # explicitly specified in template.conf
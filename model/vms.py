@@ -45,6 +45,7 @@ from wok.exception import NotFoundError
 from wok.exception import OperationFailed
 from wok.model.tasks import TaskModel
 from wok.plugins.kimchi import model
+from wok.plugins.kimchi import osinfo
 from wok.plugins.kimchi import serialconsole
 from wok.plugins.kimchi.config import config as kimchi_config
 from wok.plugins.kimchi.config import get_kimchi_version
@@ -61,8 +62,6 @@ from wok.plugins.kimchi.model.utils import get_metadata_node
 from wok.plugins.kimchi.model.utils import get_vm_name
 from wok.plugins.kimchi.model.utils import remove_metadata_node
 from wok.plugins.kimchi.model.utils import set_metadata_node
-from wok.plugins.kimchi.osinfo import defaults
-from wok.plugins.kimchi.osinfo import MEM_DEV_SLOTS
 from wok.plugins.kimchi.screenshot import VMScreenshot
 from wok.plugins.kimchi.utils import get_next_clone_name
 from wok.plugins.kimchi.utils import is_s390x
@@ -1025,7 +1024,7 @@ class VMModel(object):
         if (maxMemTag is None) and (newMem != newMaxMem):
             # Creates the maxMemory tag
             max_mem_xml = E.maxMemory(
-                str(newMaxMem), unit='Kib', slots=str(defaults['mem_dev_slots'])
+                str(newMaxMem), unit='Kib', slots=str(osinfo.defaults['mem_dev_slots'])
             )
             root.insert(0, max_mem_xml)
         elif (maxMemTag is None) and (newMem == newMaxMem):
@@ -1227,7 +1226,7 @@ class VMModel(object):
             # Check number of slots supported
             if (
                 len(xpath_get_text(xml, './devices/memory'))
-                == MEM_DEV_SLOTS[os.uname()[4]]
+                == osinfo.MEM_DEV_SLOTS[os.uname()[4]]
             ):
                 raise InvalidOperation('KCHVM0045E')
 
@@ -19,9 +19,9 @@
 import copy
 import glob
 import os
-import platform
 from collections import defaultdict
 from distutils.version import LooseVersion
+from types import MappingProxyType
 
 import psutil
 from configobj import ConfigObj
@@ -33,23 +33,43 @@ from wok.utils import wok_log
 SUPPORTED_ARCHS = {
     'x86': ('i386', 'i686', 'x86_64'),
     'power': ('ppc', 'ppc64'),
-    'ppc64le': ('ppc64le'),
-    's390x': ('s390x'),
+    'ppc64le': ('ppc64le',),
+    's390x': ('s390x',),
 }
 
-# Memory devices slot limits by architecture
-HOST_DISTRO = platform.linux_distribution()
-MEM_DEV_SLOTS = {
-    'ppc64': 32 if HOST_DISTRO and HOST_DISTRO[0] == 'Ubuntu' else 256,
-    'ppc64le': 32 if HOST_DISTRO and HOST_DISTRO[0] == 'Ubuntu' else 256,
-    'x86_64': 256,
-    'i686': 256,
-    'i386': 256,
-    's390x': 256,
+# Host machine (as in "uname -m") and the SUPPORTED_ARCHS entry it maps to
+_HOST_MACHINE = os.uname().machine
+_ARCH_INDEX = {
+    sub_arch: arch
+    for arch, sub_archs in SUPPORTED_ARCHS.items()
+    for sub_arch in sub_archs
 }
 
 
-template_specs = {
+def _get_host_distro():
+    """Return the host distro name (NAME field of /etc/os-release)."""
+    try:
+        with open('/etc/os-release') as f:
+            release = dict(line.strip().split('=', 1) for line in f if '=' in line)
+    except IOError:
+        return ''
+    return release.get('NAME', '').strip('"\'')
+
+
+def _get_mem_dev_slots():
+    # Memory devices slot limits by architecture
+    ppc_slots = 32 if _lazy('HOST_DISTRO') == 'Ubuntu' else 256
+    return {
+        'ppc64': ppc_slots,
+        'ppc64le': ppc_slots,
+        'x86_64': 256,
+        'i686': 256,
+        'i386': 256,
+        's390x': 256,
+    }
+
+
+_template_specs = {
     'x86': {
         'old': dict(disk_bus='ide', nic_model='e1000', sound_model='ich6'),
         'modern': dict(
@@ -102,6 +122,12 @@ template_specs = {
     },
 }
 
+# Read-only views, so the specs shared by every lookup() cannot be changed
+template_specs = {
+    arch: {kind: MappingProxyType(spec) for kind, spec in specs.items()}
+    for arch, specs in _template_specs.items()
+}
+
 
 custom_specs = {
     'fedora': {'22': {'x86': dict(video_model='qxl')}},
@@ -137,17 +163,33 @@ modern_version_bases = {
     },
 }
 
+# Parsed once so lookup() does not re-parse the base versions on every call
+_modern_version_bases_parsed = {
+    arch: {distro: LooseVersion(v) for distro, v in bases.items()}
+    for arch, bases in modern_version_bases.items()
+}
+
+# Declaration order is kept: later matching entries override earlier ones
+_custom_specs_parsed = {
+    distro: [(LooseVersion(v), config) for v, config in specs.items()]
+    for distro, specs in custom_specs.items()
+}
+
 
-icon_available_distros = [
-    icon[5:-4]
-    for icon in glob.glob1('%s/images/' % PluginPaths('kimchi').ui_dir, 'icon-*.png')
-]
+_POOL_PREFIX = '/plugins/kimchi/storagepools/'
+
+
+def _get_icon_available_distros():
+    return frozenset(
+        icon[5:-4]
+        for icon in glob.glob1(
+            '%s/images/' % PluginPaths('kimchi').ui_dir, 'icon-*.png'
+        )
+    )
 
 
 def _get_arch():
-    for arch, sub_archs in SUPPORTED_ARCHS.items():
-        if os.uname()[4] in sub_archs:
-            return arch
+    return _ARCH_INDEX.get(_HOST_MACHINE)
 
 
 def _get_default_template_mem():
@@ -201,7 +243,7 @@ def _get_tmpl_defaults():
         'format': 'qcow2',
         'pool': 'default',
     }
-    is_on_s390x = True if _get_arch() == 's390x' else False
+    is_on_s390x = host_arch == 's390x'
 
     if is_on_s390x:
         tmpl_defaults['storage']['disk.0']['path'] = '/var/lib/libvirt/images/'
@@ -260,7 +302,7 @@ def _get_tmpl_defaults():
     # expected by VMTemplate
     defaults = {
         'domain': 'kvm',
-        'arch': os.uname()[4],
+        'arch': _HOST_MACHINE,
         'cdrom_bus': 'ide',
         'cdrom_index': 2,
         'mouse_bus': 'ps2',
@@ -280,26 +322,16 @@ def _get_tmpl_defaults():
     storage_section = default_config.pop('storage')
     defaults['disks'] = []
 
-    for index, disk in enumerate(storage_section.keys()):
-        data = storage_section[disk]
-        data['index'] = int(disk.split('.')[1])
+    default_disk = tmpl_defaults['storage']['disk.0']
+    for disk in storage_section.keys():
+        src = storage_section[disk]
+        data = dict(src, index=int(disk.partition('.')[2]))
         # Right now 'Path' is only supported on s390x
-        if storage_section[disk].get('path') and is_on_s390x:
-            data['path'] = storage_section[disk].pop('path')
-            if 'size' not in storage_section[disk]:
-                data['size'] = tmpl_defaults['storage']['disk.0']['size']
-            else:
-                data['size'] = storage_section[disk].pop('size')
-
-            if 'format' not in storage_section[disk]:
-                data['format'] = tmpl_defaults['storage']['disk.0']['format']
-            else:
-                data['format'] = storage_section[disk].pop('format')
+        if src.get('path') and is_on_s390x:
+            data.setdefault('size', default_disk['size'])
+            data.setdefault('format', default_disk['format'])
         else:
-            data['pool'] = {
-                'name': '/plugins/kimchi/storagepools/'
-                + storage_section[disk].pop('pool')
-            }
+            data['pool'] = {'name': _POOL_PREFIX + src['pool']}
 
         defaults['disks'].append(data)
 
@@ -316,13 +348,61 @@ def _get_tmpl_defaults():
     defaults['graphics'] = default_config.pop('graphics')
 
     # Setting default memory device slots
-    defaults['mem_dev_slots'] = MEM_DEV_SLOTS.get(os.uname()[4], 256)
+    defaults['mem_dev_slots'] = _lazy('MEM_DEV_SLOTS').get(_HOST_MACHINE, 256)
 
     return defaults
 
 
-# Set defaults values according to template.conf file
-defaults = _get_tmpl_defaults()
+# Module attributes computed on first access instead of at import time, so
+# importing this module does not read template.conf, scan the UI images
+# directory or probe the host distro. Once loaded, a value is stored in the
+# module namespace: later accesses skip __getattr__ and reassignments (e.g.
+# "osinfo.defaults = ..." in tests) take effect.
+_LAZY_ATTRS = {
+    'HOST_DISTRO': _get_host_distro,
+    'MEM_DEV_SLOTS': _get_mem_dev_slots,
+    'icon_available_distros': _get_icon_available_distros,
+    # Set defaults values according to template.conf file
+    'defaults': _get_tmpl_defaults,
+}
+
+
+def __getattr__(name):
+    loader = _LAZY_ATTRS.get(name)
+    if loader is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = globals()[name] = loader()
+    return value
+
+
+def _lazy(name):
+    try:
+        return globals()[name]
+    except KeyError:
+        return __getattr__(name)
+
+
+def _copy_containers(defaults):
+    """
+    Return copies of the nested template defaults, which is much cheaper
+    than copy.deepcopy() of all of them. Only the disks are deep copied as
+    VMTemplate changes their nested pool dicts in place.
+    """
+    return {
+        'networks': copy.copy(defaults['networks']),
+        'memory': dict(defaults['memory']),
+        'cpu_info': dict(defaults['cpu_info']),
+        'graphics': dict(defaults['graphics']),
+        'disks': copy.deepcopy(defaults['disks']),
+    }
+
+
+def _copy_defaults():
+    """Return a copy of the template defaults that callers can change freely."""
+    defaults = _lazy('defaults')
+    params = defaults.copy()
+    params.update(_copy_containers(defaults))
+    return params
 
 
 def get_template_default(template_type, field):
@@ -330,9 +410,47 @@ def get_template_default(template_type, field):
     # Assuming 'power' = 'ppc64le' because lookup() does the same,
     # claiming libvirt compatibility.
     host_arch = 'power' if host_arch == 'ppc64le' else host_arch
-    tmpl_defaults = copy.deepcopy(defaults)
-    tmpl_defaults.update(template_specs[host_arch][template_type])
-    return tmpl_defaults[field]
+    spec = template_specs[host_arch][template_type]
+    if field in spec:
+        return spec[field]
+    value = _lazy('defaults')[field]
+    # Only copy containers, so callers cannot change the module defaults
+    if isinstance(value, (dict, list)):
+        value = copy.deepcopy(value)
+    return value
+
+
+def _lookup_s390x(distro, version, params):
+    # On s390x, template spec does not change based on version.
+    if not distro:
+        params['os_distro'] = params['os_version'] = 'unknown'
+    return template_specs['s390x']['old']
+
+
+def _make_versioned_lookup(arch):
+    bases = _modern_version_bases_parsed[arch]
+    old_spec = template_specs[arch]['old']
+    modern_spec = template_specs[arch]['modern']
+
+    def _lookup(distro, version, params):
+        if distro in bases:
+            if LooseVersion(version) >= bases[distro]:
+                return modern_spec
+            return old_spec
+        params['os_distro'] = params['os_version'] = 'unknown'
+        return old_spec
+
+    return _lookup
+
+
+# Host arch specific part of lookup(): returns the template spec to merge for
+# the given distro and version, marking unknown distros in params
+_LOOKUP_DISPATCH = {
+    's390x': _lookup_s390x,
+    'x86': _make_versioned_lookup('x86'),
+    'power': _make_versioned_lookup('power'),
+    'ppc64le': _make_versioned_lookup('ppc64le'),
+}
 
 
 def lookup(distro, version):
@@ -342,7 +460,7 @@ def lookup(distro, version):
     'defaults' and merging the parameters given for the identified OS.  If
     known, a link to a remote install CD is added.
     """
-    params = copy.deepcopy(defaults)
+    params = _copy_defaults()
     params['os_distro'] = distro
     params['os_version'] = version
     arch = _get_arch()
@@ -350,27 +468,14 @@ def lookup(distro, version):
     # set up arch to ppc64 instead of ppc64le due to libvirt compatibility
     if params['arch'] == 'ppc64le':
         params['arch'] = 'ppc64'
-    # On s390x, template spec does not change based on version.
-    if params['arch'] == 's390x' or arch == 's390x':
-        params.update(template_specs[arch]['old'])
-        if not distro:
-            params['os_distro'] = params['os_version'] = 'unknown'
-    elif distro in modern_version_bases[arch]:
-        if LooseVersion(version) >= LooseVersion(modern_version_bases[arch][distro]):
-            params.update(template_specs[arch]['modern'])
-        else:
-            params.update(template_specs[arch]['old'])
-    else:
-        params['os_distro'] = params['os_version'] = 'unknown'
-        params.update(template_specs[arch]['old'])
+    params.update(_LOOKUP_DISPATCH[arch](distro, version, params))
 
     # Get custom specifications
-    specs = custom_specs.get(distro, {})
-    for v, config in specs.items():
-        if LooseVersion(version) >= LooseVersion(v):
+    for v, config in _custom_specs_parsed.get(distro, []):
+        if LooseVersion(version) >= v:
             params.update(config.get(arch, {}))
 
-    if distro in icon_available_distros:
+    if distro in _lazy('icon_available_distros'):
         params['icon'] = 'plugins/kimchi/images/icon-%s.png' % distro
     else:
         params['icon'] = 'plugins/kimchi/images/icon-vm.png'
@@ -0,0 +1,85 @@
+#
+# Project Kimchi
+#
+# Copyright IBM Corp, 2016
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+import unittest
+
+import mock
+from wok.plugins.kimchi.model.featuretests import FeatureTests
+
+
+def _mock_conn(uri='test:///default'):
+    conn = mock.Mock()
+    conn.getType.return_value = 'Test'
+    conn.getURI.return_value = uri
+    return conn
+
+
+class FeatureTestsCacheTests(unittest.TestCase):
+    def setUp(self):
+        FeatureTests.invalidate()
+        self.addCleanup(FeatureTests.invalidate)
+
+    def test_iso_stream_probe_is_cached(self):
+        conn = _mock_conn()
+        self.assertTrue(FeatureTests.libvirt_supports_iso_stream(conn, 'http'))
+        self.assertTrue(FeatureTests.libvirt_supports_iso_stream(conn, 'http'))
+        self.assertEqual(1, conn.defineXML.call_count)
+
+    def test_fc_host_probe_is_cached(self):
+        conn = _mock_conn()
+        self.assertTrue(FeatureTests.libvirt_support_fc_host(conn))
+        self.assertTrue(FeatureTests.libvirt_support_fc_host(conn))
+        self.assertEqual(1, conn.storagePoolDefineXML.call_count)
+
+    def test_mem_hotplug_probe_is_cached(self):
+        conn = _mock_conn()
+        conn.defineXML.return_value.isActive.return_value = 0
+        self.assertTrue(FeatureTests.has_mem_hotplug_support(conn))
+        self.assertTrue(FeatureTests.has_mem_hotplug_support(conn))
+        self.assertEqual(1, conn.defineXML.call_count)
+
+    @mock.patch('wok.plugins.kimchi.model.featuretests.run_command')
+    def test_kernel_vfio_probe_is_cached(self, mock_run_command):
+        mock_run_command.return_value = ['', '', 0]
+        self.assertTrue(FeatureTests.kernel_support_vfio())
+        self.assertTrue(FeatureTests.kernel_support_vfio())
+        mock_run_command.assert_called_once_with(['modprobe', 'vfio-pci'])
+
+    def test_cache_keys_per_uri_and_protocol(self):
+        conn = _mock_conn()
+        other_conn = _mock_conn(uri='qemu:///system')
+        FeatureTests.libvirt_supports_iso_stream(conn, 'http')
+        FeatureTests.libvirt_supports_iso_stream(conn, 'ftp')
+        FeatureTests.libvirt_supports_iso_stream(other_conn, 'http')
+        self.assertEqual(2, conn.defineXML.call_count)
+        self.assertEqual(1, other_conn.defineXML.call_count)
+
+        FeatureTests.libvirt_support_fc_host(conn)
+        FeatureTests.libvirt_support_fc_host(other_conn)
+        self.assertEqual(1, conn.storagePoolDefineXML.call_count)
+        self.assertEqual(1, other_conn.storagePoolDefineXML.call_count)
+
+    def test_invalidate_runs_probes_again(self):
+        conn = _mock_conn()
+        FeatureTests.libvirt_supports_iso_stream(conn, 'http')
+        FeatureTests.libvirt_support_fc_host(conn)
+        FeatureTests.invalidate()
+        FeatureTests.libvirt_supports_iso_stream(conn, 'http')
+        FeatureTests.libvirt_support_fc_host(conn)
+        self.assertEqual(2, conn.defineXML.call_count)
+        self.assertEqual(2, conn.storagePoolDefineXML.call_count)
@@ -16,13 +16,18 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+import json
 import os
 import unittest
+from distutils.version import LooseVersion
 
+import mock
+from wok.plugins.kimchi import osinfo
 from wok.plugins.kimchi.osinfo import _get_arch
 from wok.plugins.kimchi.osinfo import get_template_default
 from wok.plugins.kimchi.osinfo import lookup
 from wok.plugins.kimchi.osinfo import modern_version_bases
+from wok.plugins.kimchi.osinfo import template_specs
 
 
 class OSInfoTests(unittest.TestCase):
@@ -89,3 +94,107 @@ class OSInfoTests(unittest.TestCase):
                          get_template_default('old', 'disk_bus'))
         self.assertEqual(entry['nic_model'],
                          get_template_default('old', 'nic_model'))
+
+    def test_lookup_spec_precedence(self):
+        arch = _get_arch()
+        # custom spec > template spec > defaults
+        custom_specs = {
+            'custom_distro': [
+                (LooseVersion('1.0'), {arch: {'nic_model': 'custom-nic'}})
+            ]
+        }
+        defaults = dict(
+            osinfo.defaults, disk_bus='default-bus', nic_model='default-nic'
+        )
+        with mock.patch.object(
+            osinfo, '_custom_specs_parsed', custom_specs
+        ), mock.patch.object(osinfo, 'defaults', defaults):
+            entry = lookup('custom_distro', '1.0')
+
+        self.assertEqual('custom-nic', entry['nic_model'])
+        self.assertEqual(
+            template_specs[arch]['old']['disk_bus'], entry['disk_bus'])
+        self.assertEqual(defaults['domain'], entry['domain'])
+
+    def test_lookup_writes_do_not_reach_shared_data(self):
+        arch = _get_arch()
+        specs = {kind: dict(spec) for kind, spec in template_specs[arch].items()}
+        defaults = json.dumps(osinfo.defaults, sort_keys=True)
+
+        entry = lookup('unknown_distro', 'unknown_version')
+        entry['disk_bus'] = 'changed'
+        entry['domain'] = 'changed'
+        entry['memory']['current'] = 1
+        entry['cpu_info']['vcpus'] = 64
+        entry['graphics']['type'] = 'changed'
+
+        # VMTemplate merges the result into its own dict and then changes
+        # the disks in place
+        info = {}
+        info.update(lookup('unknown_distro', 'unknown_version'))
+        info['disks'][0]['index'] = 99
+        if isinstance(info['disks'][0].get('pool'), dict):
+            info['disks'][0]['pool']['type'] = 'changed'
+        if isinstance(info['networks'], list):
+            info['networks'].append('changed')
+
+        self.assertEqual(
+            specs,
+            {kind: dict(spec) for kind, spec in template_specs[arch].items()},
+        )
+        self.assertEqual(defaults, json.dumps(osinfo.defaults, sort_keys=True))
+
+    def _get_host_distro(self, os_release):
+        with mock.patch(
+            'wok.plugins.kimchi.osinfo.open',
+            mock.mock_open(read_data=os_release),
+            create=True,
+        ):
+            return osinfo._get_host_distro()
+
+    def _get_mem_dev_slots(self, host_distro):
+        with mock.patch.object(osinfo, 'HOST_DISTRO', host_distro, create=True):
+            return osinfo._get_mem_dev_slots()
+
+    def test_host_distro_quoted_name(self):
+        distro = self._get_host_distro('NAME="Ubuntu"\nVERSION_ID="16.04"\n')
+        self.assertEqual('Ubuntu', distro)
+        slots = self._get_mem_dev_slots(distro)
+        self.assertEqual(32, slots['ppc64'])
+        self.assertEqual(32, slots['ppc64le'])
+        self.assertEqual(256, slots['x86_64'])
+
+    def test_host_distro_unquoted_name(self):
+        distro = self._get_host_distro('NAME=Fedora\nID=fedora\n')
+        self.assertEqual('Fedora', distro)
+        self.assertEqual(256, self._get_mem_dev_slots(distro)['ppc64le'])
+
+    def test_host_distro_ignores_comments(self):
+        os_release = (
+            '# NAME=Ubuntu\n# Generated file, do not edit\nNAME="openSUSE Leap"\n'
+        )
+        self.assertEqual('openSUSE Leap', self._get_host_distro(os_release))
+
+    def test_host_distro_missing_os_release(self):
+        with mock.patch(
+            'wok.plugins.kimchi.osinfo.open', side_effect=IOError, create=True
+        ):
+            distro = osinfo._get_host_distro()
+        self.assertEqual('', distro)
+        slots = self._get_mem_dev_slots(distro)
+        self.assertEqual(256, slots['ppc64'])
+        self.assertEqual(256, slots['ppc64le'])
+
+    def test_get_arch_matches_whole_machine_names(self):
+        machines = {
+            'x86_64': 'x86',
+            'ppc64': 'power',
+            'ppc64le': 'ppc64le',
+            's390x': 's390x',
+            # used to match 's390x' by substring
+            's390': None,
+            'unknown_machine': None,
+        }
+        for machine, arch in machines.items():
+            with mock.patch.object(osinfo, '_HOST_MACHINE', machine):
+                self.assertEqual(arch, _get_arch(), machine)